@@ -1,7 +1,6 @@
 import chainlit as cl
 from langchain_core.messages import AIMessageChunk, HumanMessage
-from langgraph.checkpoint.memory import InMemorySaver
-import uuid
+import logging
 import pandas as pd
 
 import sys
@@ -11,6 +10,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from quiz_agentic_design import create_chill_tutor_graph
 from state import OrchestratorState
 
+logger = logging.getLogger(__name__)
+
+# Compile the graph once and reuse it across turns and sessions. No checkpointer:
+# each turn passes the full state in and takes the final state from the stream.
+graph = create_chill_tutor_graph()
+
 
 def create_initial_state():
     """Create initial tutor state with default values"""
@@ -36,12 +41,37 @@ def create_initial_state():
     }
     return state
 
+async def show_node_update(update: dict, steps: dict):
+    """Surface planner and evaluator progress as Chainlit steps.
+
+    Args:
+        update: A LangGraph "updates" chunk mapping node names to their output
+        steps: Steps opened earlier in this turn, keyed by node name
+    """
+    for node, values in update.items():
+        if not isinstance(values, dict):
+            continue
+        if node == "planner":
+            plan = values.get("current_plan") or {}
+            async with cl.Step(name="planner", type="tool") as step:
+                step.output = plan.get("string") or "Planning the next step"
+        elif node == "executor":
+            quiz_state = values.get("quiz_state")
+            if isinstance(quiz_state, dict) and quiz_state.get("state") == "awaiting_evaluation":
+                step = cl.Step(name="evaluator", type="tool")
+                step.output = "Evaluating your answer..."
+                await step.send()
+                steps["evaluator"] = step
+        elif node == "evaluator" and "evaluator" in steps:
+            step = steps.pop("evaluator")
+            step.output = "Answer evaluated"
+            await step.update()
+
 @cl.on_chat_start
 async def on_chat_start():
     """Initialize the quiz session"""
     initial_state = create_initial_state()
     cl.user_session.set("tutor_state", initial_state)
-    cl.user_session.set("thread_id", str(2))
     cl.user_session.set("topics", initial_state["topics"])
         # Create a sample DataFrame with more than 10 rows to test pagination functionality
     
@@ -54,7 +84,6 @@ async def on_message(message: cl.Message):
     """Handle quiz interactions"""
     last_human_message = message.content
     msg = cl.Message(content="")
-    thread_id = cl.user_session.get("thread_id")
     
     # Get state from session
     current_state = cl.user_session.get("tutor_state")
@@ -66,24 +95,24 @@ async def on_message(message: cl.Message):
     current_state["messages"].append(HumanMessage(content=last_human_message))
     cl.user_session.set("tutor_state", current_state)
     current_state["topics"] = cl.user_session.get("topics")
-    
-    # Initialize checkpointer with current state
-    checkpointer = InMemorySaver()
-    print("current_state ========>",current_state)
-
-    
-    graph = create_chill_tutor_graph(checkpointer=checkpointer)
+    logger.debug("current_state ========> %s", current_state)
 
     # Process message through graph and collect AI response
-    # Pass complete state to graph
-    async for chunk in graph.astream(
+    # Pass complete state to graph; stream responder tokens and node updates,
+    # and keep the last full state snapshot instead of re-reading it afterwards
+    steps = {}
+    output_state = current_state
+    async for mode, chunk in graph.astream(
         current_state,  # Pass full state
-        {"configurable": {"thread_id": thread_id}},
-        stream_mode="messages"):
-        if isinstance(chunk[0], AIMessageChunk) and chunk[1]["langgraph_node"] == "responder":
-            await msg.stream_token(chunk[0].content)
+        stream_mode=["messages", "updates", "values"]):
+        if mode == "messages":
+            if isinstance(chunk[0], AIMessageChunk) and chunk[1]["langgraph_node"] == "responder":
+                await msg.stream_token(chunk[0].content)
+        elif mode == "updates":
+            await show_node_update(chunk, steps)
+        elif mode == "values":
+            output_state = chunk
 
-    output_state = await graph.aget_state(config={"configurable": {"thread_id": thread_id}})
-    print("output_state ========>",output_state)
+    logger.debug("output_state ========> %s", output_state)
 
-    cl.user_session.set("tutor_state", output_state.values)
\ No newline at end of file
+    cl.user_session.set("tutor_state", output_state)
\ No newline at end of file
@@ -0,0 +1,92 @@
+from typing import Any, Dict, Mapping, Optional, Tuple
+from collections import defaultdict
+from types import MappingProxyType
+from tutor_db import FlashcardRow, get_all_flashcards
+
+# Cached topic_id -> flashcards index and per-topic state templates. Empty
+# results are never cached, so lookups made before the database is seeded
+# keep re-reading it until flashcards appear.
+_flashcard_index: Optional[Dict[int, Tuple[FlashcardRow, ...]]] = None
+_state_templates_by_topic: Dict[int, Tuple[Mapping[str, Any], ...]] = {}
+
+def load_flashcard_index() -> Dict[int, Tuple[FlashcardRow, ...]]:
+    """Load all flashcards from the database once and index them by topic.
+    
+    Flashcards are static reference data, so a non-empty table is read on first
+    use and kept for the lifetime of the process. Call reload_flashcards() after
+    reseeding or dropping tables in the same process.
+    
+    Returns:
+        Dictionary mapping topic_id to a tuple of flashcard rows
+    """
+    global _flashcard_index
+    if _flashcard_index is not None:
+        return _flashcard_index
+    
+    index = defaultdict(list)
+    for flashcard in get_all_flashcards():
+        index[flashcard.topic_id].append(flashcard)
+    flashcard_index = {topic_id: tuple(flashcards) for topic_id, flashcards in index.items()}
+    if flashcard_index:
+        _flashcard_index = flashcard_index
+    return flashcard_index
+
+def _normalize_topic_id(topic_id: Any) -> Optional[int]:
+    """Convert an int or numeric string topic ID to an int, or None if invalid."""
+    try:
+        return int(topic_id)
+    except (TypeError, ValueError):
+        return None
+
+def get_topic_flashcards(topic_id: Any) -> Tuple[FlashcardRow, ...]:
+    """Return the cached flashcards for a topic.
+    
+    Args:
+        topic_id: ID of the topic, as an int or numeric string
+        
+    Returns:
+        Tuple of flashcard rows, empty if the topic is unknown
+    """
+    topic_id = _normalize_topic_id(topic_id)
+    if topic_id is None:
+        return ()
+    return load_flashcard_index().get(topic_id, ())
+
+def _build_state_templates(topic_id: Optional[int]) -> Tuple[Mapping[str, Any], ...]:
+    return tuple(
+        MappingProxyType({
+            "id": flashcard.id,
+            "status": "queued",
+            "question": flashcard.question,
+            "marking_criteria": flashcard.marking_criteria,
+            "attempts": 0,
+            "evaluation": None
+        })
+        for flashcard in get_topic_flashcards(topic_id)
+    )
+
+def get_topic_state_templates(topic_id: Any) -> Tuple[Mapping[str, Any], ...]:
+    """Return read-only flashcard state templates for a topic.
+    
+    Each template holds every flashcard state field except the mutable
+    `user_answers` list, so a fresh state is just `{**template, "user_answers": []}`.
+    
+    Args:
+        topic_id: ID of the topic, as an int or numeric string
+        
+    Returns:
+        Tuple of read-only mappings, empty if the topic is unknown
+    """
+    topic_id = _normalize_topic_id(topic_id)
+    templates = _state_templates_by_topic.get(topic_id)
+    if templates is None:
+        templates = _build_state_templates(topic_id)
+        if templates:
+            _state_templates_by_topic[topic_id] = templates
+    return templates
+
+def reload_flashcards() -> None:
+    """Drop the cached flashcards so the next lookup re-reads the database."""
+    global _flashcard_index
+    _flashcard_index = None
+    _state_templates_by_topic.clear()
@@ -0,0 +1,73 @@
+from typing import Any, Dict, Optional, Protocol
+from collections import OrderedDict
+from threading import Lock
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(Protocol):
+    """Minimal key/value interface used to cache LLM results."""
+
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    def set(self, key: str, value: Any) -> None:
+        ...
+
+
+class InMemoryCache:
+    """Bounded, thread-safe LRU cache held in process memory.
+
+    Args:
+        max_entries: Maximum number of entries kept before the least
+            recently used one is evicted
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def normalize_text(value: Any) -> Any:
+    """Collapse whitespace so trivially different strings share a cache key."""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+
+def make_cache_key(namespace: str, inputs: Dict[str, Any]) -> str:
+    """Build a deterministic SHA-256 cache key for a chain input.
+
+    Args:
+        namespace: Name of the chain the key belongs to (e.g. 'evaluator')
+        inputs: The variables passed to the chain
+
+    Returns:
+        A string key of the form '<namespace>:<hex digest>'
+    """
+    normalized = {key: normalize_text(value) for key, value in inputs.items()}
+    payload = json.dumps(normalized, sort_keys=True, default=str)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+# Evaluator calls run at temperature=0, so identical inputs give identical results
+evaluator_cache: CacheBackend = InMemoryCache()
@@ -1,7 +1,9 @@
 from typing import Dict, Optional
+from collections import ChainMap
 from pathlib import Path
-import json
+import asyncio
 import os
+import orjson
 import re
 import logging
 from datetime import datetime
@@ -9,7 +11,6 @@ from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_groq import ChatGroq
 from langgraph.graph import StateGraph, END
-from langgraph.graph.message import add_messages
 from langchain.prompts.chat import ChatPromptTemplate
 
 from state_utils import (
@@ -19,6 +20,9 @@ from state_utils import (
 )
 from IPython.display import display, JSON
 from state import OrchestratorState
+from base_models import EvaluationResult
+from llm_cache import evaluator_cache, make_cache_key
+from telemetry import timed_node, set_span_attributes, record_token_usage
 from langchain_core.messages import AIMessage, HumanMessage
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +37,22 @@ load_dotenv()
 # ---------- Learning Session Orchestrator (Planner) ----------
 
 # ---------- Planner Node ----------
+
+# Number of most recent messages forwarded to the planner. Planning decisions
+# are driven by quiz_state and flashcard_states, so older turns are not needed.
+PLANNER_MESSAGE_WINDOW = 6
+
+# Attempts allowed per flashcard before moving on (matches the responder prompt)
+MAX_ATTEMPTS = 3
+
+# Replies that only acknowledge feedback, so the post-evaluation plan can be
+# built without the planner LLM. Compared lowercased, without punctuation.
+ACKNOWLEDGEMENTS = frozenset({
+    "", "ok", "okay", "k", "next", "next question", "continue", "go on", "yes",
+    "yep", "sure", "ready", "got it", "thanks", "thank you", "cool", "done"
+})
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
 def convert_message(msg):
     """Convert a message object to a serializable dict."""
     if isinstance(msg, (HumanMessage, AIMessage)):
@@ -44,7 +64,107 @@ def convert_message(msg):
         return msg
     return msg
 
-def generate_plan(state: OrchestratorState):
+def _json_default(obj):
+    """orjson fallback that serializes LangChain messages via convert_message."""
+    if isinstance(obj, (HumanMessage, AIMessage)):
+        return convert_message(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _latest_human_message(messages) -> Optional[str]:
+    """Return the content of the most recent user message, if any."""
+    for msg in reversed(messages or []):
+        msg = convert_message(msg)
+        if isinstance(msg, dict) and msg.get("role") in ("human", "user"):
+            return msg.get("content")
+    return None
+
+def is_acknowledgement(text: Optional[str]) -> bool:
+    """Check whether a user message only acknowledges feedback (e.g. 'ok', 'next')."""
+    if not isinstance(text, str):
+        return text is None
+    normalized = " ".join(_PUNCTUATION_RE.sub(" ", text.lower()).split())
+    return normalized in ACKNOWLEDGEMENTS
+
+def plan_after_evaluation(state: OrchestratorState) -> Optional[Dict]:
+    """Build the post-evaluation plan deterministically, without the planner LLM.
+    
+    Once the active flashcard has been evaluated, the next transition follows
+    fixed rules (the same ones the orchestrator prompt demonstrates):
+    - correct answer: complete the card and activate the next queued one
+    - max attempts reached: as above, and mark the card as hard
+    - otherwise: keep the card active and wait for another attempt
+    The quiz is marked session_complete when no queued card is left.
+    
+    The fast path is only taken when the latest user message is a bare
+    acknowledgement (see ACKNOWLEDGEMENTS). Any other message, such as a
+    question or a request to change topic, is left to the planner LLM.
+    
+    Args:
+        state: Current orchestrator state
+        
+    Returns:
+        A plan in the current_plan format, or None if the state is not a
+        post-evaluation state or the user asked for something else, and the
+        planner LLM should decide
+    """
+    quiz_state = state.get("quiz_state")
+    if not isinstance(quiz_state, dict) or quiz_state.get("state") != "awaiting_evaluation":
+        return None
+    if not is_acknowledgement(_latest_human_message(state.get("messages"))):
+        return None
+    
+    flashcard_states = state.get("flashcard_states")
+    if not isinstance(flashcard_states, list):
+        return None
+    active_card = next(
+        (card for card in flashcard_states if card.get("status") == "active"), None
+    )
+    if active_card is None or not active_card.get("evaluation"):
+        return None
+    
+    result = active_card["evaluation"].get("result")
+    max_attempts_reached = active_card.get("attempts", 0) >= MAX_ATTEMPTS
+    
+    if result != "correct" and not max_attempts_reached:
+        description = "Handle incorrect answer and prepare for next attempt"
+        updates = [("quiz_state", {"state": "awaiting_answer"})]
+    else:
+        next_card = next(
+            (card for card in flashcard_states if card.get("status") == "queued"), None
+        )
+        card_updates = [{"id": active_card["id"], "status": "completed"}]
+        if next_card is not None:
+            card_updates.append({"id": next_card["id"], "status": "active"})
+        progress = sum(1 for card in flashcard_states if card.get("status") == "completed") + 1
+        
+        updates = [("flashcard_states", card_updates)]
+        if result != "correct":
+            hard_flashcards = list(state.get("hard_flashcards") or [])
+            if active_card["id"] not in hard_flashcards:
+                hard_flashcards.append(active_card["id"])
+            updates.append(("hard_flashcards", hard_flashcards))
+        
+        if next_card is None:
+            description = "Complete the quiz session and update final states"
+            updates.append(("quiz_state", {"state": "session_complete", "progress": progress}))
+        else:
+            description = "Progress to next question and update states"
+            updates.append(("quiz_state", {"state": "awaiting_answer", "progress": progress}))
+    
+    return {
+        "steps": [
+            {
+                "description": description,
+                "step_id": "E1",
+                "tool": "bulk_set_state",
+                "tool_input": updates
+            }
+        ],
+        "string": description
+    }
+
+@timed_node("planner")
+async def generate_plan(state: OrchestratorState):
     """Learning Session Orchestrator node that plans the next steps in the learning journey.
     
     This node is responsible for:
@@ -58,11 +178,19 @@ def generate_plan(state: OrchestratorState):
         state: Current orchestrator state containing user progress, flashcards, and session info
         
     Returns:
-        Updated state with new plan and any state transitions
+        State update containing the new current_plan and the previous_plan
     """
     # Validate state
     if not isinstance(state, dict):
         raise TypeError("State must be a dictionary")
+    
+    # Post-evaluation transitions are deterministic, so skip the planner LLM
+    deterministic_plan = plan_after_evaluation(state)
+    if deterministic_plan is not None:
+        return {
+            "previous_plan": state.get("current_plan", {"steps": [], "string": ""}),
+            "current_plan": deterministic_plan
+        }
         
     # Extract only the essential fields required by the orchestrator prompt
     essential_state = {
@@ -71,7 +199,7 @@ def generate_plan(state: OrchestratorState):
         "score": state.get("score", {"correct": 0, "incorrect": 0, "total_attempts": 0}),
         "quiz_state": state.get("quiz_state", {}),
         "user": state.get("user", {}),
-        "messages": [convert_message(msg) for msg in state.get("messages", [])],
+        "messages": [convert_message(msg) for msg in state.get("messages", [])[-PLANNER_MESSAGE_WINDOW:]],
         "hard_flashcards": state.get("hard_flashcards", []),
         "session": state.get("session", {
             "intent": "start_quizzing",
@@ -84,7 +212,7 @@ def generate_plan(state: OrchestratorState):
     try:
         # Create and invoke the planner chain
         planner_chain = create_planner_chain()
-        response = planner_chain.invoke({
+        response = await planner_chain.ainvoke({
             "current_topic_id": essential_state.get("current_topic_id"),
             "topics": essential_state.get("topics", []),
             "flashcard_states": essential_state.get("flashcard_states", []),
@@ -94,49 +222,47 @@ def generate_plan(state: OrchestratorState):
             "messages": essential_state.get("messages", []),
             "hard_flashcards": essential_state.get("hard_flashcards", [])
         })
+        record_token_usage(response)
         
-        # Parse the raw text response
-        result = parse_llm_plan_response(response.content)
+        # Parse the raw text response, converting steps as they are parsed
+        steps = [
+            {
+                "description": plan_desc,
+                "step_id": step_id,
+                "tool": tool_name,
+                "tool_input": tool_input
+            } for plan_desc, step_id, tool_name, tool_input in parse_llm_plan_response(response.content)
+        ]
         
-        # Create new state object with updates from planner
-        new_state = dict(state)  # Create a copy to avoid modifying the original
-    
-        # Update current and previous plans
-        new_state["previous_plan"] = state.get("current_plan", {"steps": [], "string": ""})
-        
-        # Get the plan description from the first tuple (if any)
-        plan_description = result[0][0] if result else ""
+        # Get the plan description from the first step (if any)
+        plan_description = steps[0]["description"] if steps else ""
         
-        # Convert parsed steps to the expected format
-        new_state["current_plan"] = {
-            "steps": [
-                {
-                    "description": plan_desc,
-                    "step_id": step_id,
-                    "tool": tool_name,
-                    "tool_input": tool_input
-                } for plan_desc, step_id, tool_name, tool_input in result
-            ],
-            "string": plan_description
+        # Return only the plan fields; LangGraph merges them into the state
+        return {
+            "previous_plan": state.get("current_plan", {"steps": [], "string": ""}),
+            "current_plan": {
+                "steps": steps,
+                "string": plan_description
+            }
         }
         
-        return new_state
-        
     except Exception as e:
         logger.error(f"Failed to generate plan: {e}")
         raise
 
 
 # ---------- Evaluator Node ----------
-def evaluate(state: OrchestratorState):
-    """Evaluate the current answer in the state"""
-    
-    # Create a mutable copy of the state
-    current_state = dict(state)
+@timed_node("evaluator")
+async def evaluate(state: OrchestratorState):
+    """Evaluate the current answer in the state.
+
+    Returns:
+        State update containing the re-evaluated flashcard_states and score
+    """
     
     # Find the active flashcard and its index
     active_index = next(
-        (i for i, card in enumerate(current_state["flashcard_states"]) 
+        (i for i, card in enumerate(state["flashcard_states"]) 
          if card["status"] == "active"),
         None
     )
@@ -144,7 +270,7 @@ def evaluate(state: OrchestratorState):
     if active_index is None:
         raise ValueError("No active flashcard found in state")
     
-    active_flashcard = current_state["flashcard_states"][active_index]
+    active_flashcard = state["flashcard_states"][active_index]
     
     # Get the latest user answer
     if not active_flashcard["user_answers"]:
@@ -159,9 +285,19 @@ def evaluate(state: OrchestratorState):
         "student_answer": student_answer
     }
     
-    # Get evaluation from the chain
-    evaluation_chain = create_evaluator_chain()
-    evaluation_result = evaluation_chain.invoke(evaluator_input)
+    # Get evaluation from the cache, falling back to the chain
+    cache_key = make_cache_key("evaluator", evaluator_input)
+    cached_result = evaluator_cache.get(cache_key)
+    set_span_attributes(cache_hit=cached_result is not None)
+    if cached_result is not None:
+        logger.debug("Evaluator cache hit")
+        # Cached values were validated by the output parser when they came
+        # back from the LLM, so rebuild the model without re-validating
+        evaluation_result = EvaluationResult.model_construct(**cached_result)
+    else:
+        evaluation_chain = create_evaluator_chain()
+        evaluation_result = await evaluation_chain.ainvoke(evaluator_input)
+        evaluator_cache.set(cache_key, evaluation_result.model_dump())
 
     # Create updated flashcard with new evaluation
     updated_flashcard = dict(active_flashcard)
@@ -171,22 +307,23 @@ def evaluate(state: OrchestratorState):
         "feedback": evaluation_result.feedback
     }
     
-    # Update the flashcard in the state's flashcard_states list
-    current_state["flashcard_states"][active_index] = updated_flashcard
+    # Replace the flashcard in a new flashcard_states list
+    flashcard_states = list(state["flashcard_states"])
+    flashcard_states[active_index] = updated_flashcard
     
-    # Update score in state
-    if "score" not in current_state:
-        current_state["score"] = {"correct": 0, "incorrect": 0, "total_attempts": 0}
+    # Update score
+    score = dict(state.get("score") or {"correct": 0, "incorrect": 0, "total_attempts": 0})
  
-    current_state["score"]["total_attempts"] = current_state["score"].get("total_attempts", 0) + 1
+    score["total_attempts"] = score.get("total_attempts", 0) + 1
     if evaluation_result.result == "correct":
-        current_state["score"]["correct"] = current_state["score"].get("correct", 0) + 1
+        score["correct"] = score.get("correct", 0) + 1
     elif evaluation_result.result == "incorrect":
-        current_state["score"]["incorrect"] = current_state["score"].get("incorrect", 0) + 1
+        score["incorrect"] = score.get("incorrect", 0) + 1
     
-    return current_state
+    return {"flashcard_states": flashcard_states, "score": score}
 
 # ---------- Plan Executor ----------
+@timed_node("executor")
 def execute_plan(state: OrchestratorState):
     """Execute the plan generated by the Learning Session Orchestrator.
     
@@ -201,53 +338,50 @@ def execute_plan(state: OrchestratorState):
         state: Current orchestrator state containing the plan to execute
         
     Returns:
-        Updated state after plan execution
+        State update containing only the fields changed by the plan
     """
-    print("\n=== Starting Plan Execution ===")
-    print(f"Initial State Keys: {list(state.keys())}")
+    logger.debug("=== Starting Plan Execution ===")
+    logger.debug("Initial State Keys: %s", state.keys())
     
     # Get the current plan from state
     current_plan = state.get("current_plan", {"steps": [], "string": ""})
-    print(f"\nCurrent Plan: {current_plan['string']}")
-    print(f"Number of Steps: {len(current_plan['steps'])}")
-
-    # Get the current plan from state
-    current_plan = state.get("current_plan", {"steps": [], "string": ""})
+    logger.debug("Current Plan: %s", current_plan["string"])
+    logger.debug("Number of Steps: %d", len(current_plan["steps"]))
     
-    # Create a mutable copy of the state
-    current_state = dict(state)
+    # Collect changes separately; later steps see them layered over the state
+    changes = {}
+    current_state = ChainMap(changes, state)
     
     # Process each step in the plan
-    for step in current_plan["steps"]:
-        print(f"\nStep {current_plan['steps'].index(step)+1} of {len(current_plan['steps'])}")
+    for step_number, step in enumerate(current_plan["steps"], 1):
+        logger.debug("Step %d of %d", step_number, len(current_plan["steps"]))
         
 
         tool_name = step["tool"]
         tool_input = step["tool_input"]
-        print(f"\nTool input: {tool_input}")
+        logger.debug("Tool input: %s", tool_input)
         if tool_name == "bulk_set_state":
             updated_values = bulk_set_state(current_state, tool_input)
             if updated_values:
-                current_state.update(updated_values)
-            #print(f"\nExecution Result: {updated_values}")
+                changes.update(updated_values)
         if tool_name == "populate_flashcards":
             flashcard_states = populate_flashcards(tool_input[0][1])
             if flashcard_states:
-                current_state["flashcard_states"] = flashcard_states
-            #print(f"\nExecution Result: {flashcard_states}")
+                changes["flashcard_states"] = flashcard_states
     # Return in LangGraph format
-    print(f"\nExecution Result: {current_state}")
-    return current_state
+    logger.debug("Execution Result: %s", changes)
+    return changes
 
 # ---------- Response Generator ----------
 
-def respond(state: OrchestratorState):
+@timed_node("responder")
+async def respond(state: OrchestratorState):
     """Generate contextual responses based on current state.
     
     This node:
     1. Prepares relevant context from state
     2. Generates appropriate responses
-    3. Manages message history using LangGraph's add_messages
+    3. Appends to message history through the messages reducer
     4. Handles error cases gracefully
     5. Provides feedback based on flashcard difficulty levels
     
@@ -255,17 +389,15 @@ def respond(state: OrchestratorState):
         state: Current orchestrator state containing context for response generation
         
     Returns:
-        Updated state with new response added to message history
+        State update containing the new response message
     """
-    print("\n=== Starting Response Generation ===")
+    logger.debug("=== Starting Response Generation ===")
     
-    # Create serializable state by converting messages
-    serializable_state = state.copy()
-    serializable_state["messages"] = [convert_message(msg) for msg in state.get("messages", [])]
-    
-    # Create the responder chain
+    # Serialize the state compactly; messages are converted by _json_default
     chain_input = {
-        "state_json": json.dumps(serializable_state, indent=2)
+        "state_json": orjson.dumps(
+            state, default=_json_default, option=orjson.OPT_NON_STR_KEYS
+        ).decode()
     }
     
     # Create chain
@@ -273,18 +405,17 @@ def respond(state: OrchestratorState):
     
     # Invoke the chain
     try:
-        response = chain.invoke(chain_input)
-        print(f"Generated response: {response.content}")
+        response = await chain.ainvoke(chain_input)
+        record_token_usage(response)
+        logger.debug("Generated response: %s", response.content)
         
-        # Use LangGraph's add_message utility to append the new message
-        new_message = [{"role": "assistant", "content": response.content}]
-        state["messages"] = add_messages(state.get("messages", []), new_message)
-        return state
+        # The MessagesState reducer appends the new message to the history
+        return {"messages": [AIMessage(content=response.content)]}
         
     except Exception as e:
         logger.error(f"Response generation failed: {e}")
-        # Return original state on error
-        return state
+        # Leave the state unchanged on error
+        return {}
 # ---------- Conditional Edge Function ----------
 def route_to_evaluation_or_response(state: OrchestratorState):
     """Route the workflow to evaluation or direct response based on quiz state.
@@ -327,7 +458,10 @@ def create_chill_tutor_graph(checkpointer=None):
        - Maintains conversation flow
        - Provides educational feedback
     
-    Flow: planner -> executor -> responder -> END
+    Flow: planner -> executor -> [evaluator] -> responder -> END
+
+    The executor only reaches the responder through the conditional edge, so
+    on evaluation turns the responder runs once, after the evaluator.
     
     Returns:
         Compiled LangGraph workflow ready for execution
@@ -347,7 +481,6 @@ def create_chill_tutor_graph(checkpointer=None):
 
         # Add edges after all nodes are defined
         workflow.add_edge("planner", "executor")
-        workflow.add_edge("executor", "responder")
         workflow.add_edge("evaluator", "responder")
         workflow.add_edge("responder", END)
 
@@ -443,7 +576,7 @@ def main() -> None:
         
         # Run the graph with the initial state
         try:
-            result = graph.invoke(evaluation_state)
+            result = asyncio.run(graph.ainvoke(evaluation_state))
             logger.info("\nLearning Session Orchestrator Plan:")
             from pprint import pprint
             pprint(result)
@@ -1,4 +1,5 @@
-from tutor_db import get_db
+from tutor_db import get_db, reset_schema_version
+from flashcard_store import reload_flashcards
 
 # Example data from example_states.py
 topics = [
@@ -34,6 +35,8 @@ def seed_db():
             flashcards
         )
         db.commit()
+    # Let this process pick up the new flashcards
+    reload_flashcards()
 
 def delete_all_tables():
     """Delete all tables (topics, flashcards) from the database."""
@@ -43,6 +46,9 @@ def delete_all_tables():
         db.execute("DROP TABLE IF EXISTS topics")
         db.execute("DROP TABLE IF EXISTS flashcards_new")
         db.commit()
+    # Let the next init_db() call recreate the schema
+    reset_schema_version()
+    reload_flashcards()
 
 if __name__ == "__main__":
     seed_db()
@@ -1,20 +1,41 @@
-from typing import List, Tuple, Any, Dict, Union
-from copy import deepcopy
+from typing import List, Tuple, Any, Dict, Iterator, Union
 from dataclasses import is_dataclass, asdict
-import json
+from functools import lru_cache
+import orjson
 import os
+import re
 from pathlib import Path
 import logging
-from tutor_db import get_flashcards_by_topic_id
+from flashcard_store import get_topic_state_templates
 from langchain_core.messages import AIMessage
 from langchain_groq import ChatGroq
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.output_parsers import PydanticOutputParser
-from base_models import EvaluationResult, PlannerResult
+from base_models import EvaluationResult
 
 logger = logging.getLogger(__name__)
 
+# Plan section header, e.g. "Plan: Set up Data topic" (anchored at line start)
+_PLAN_RE = re.compile(r"^Plan:[ \t]*", re.MULTILINE)
+# Step header in a plan, e.g. "#E1 = bulk_set_state[" (anchored at line start)
+_STEP_RE = re.compile(r"^#E(\d+)\s*=\s*([A-Za-z_]\w*)\s*\[", re.MULTILINE)
+# Brackets only, so bracket matching skips everything else in one C-level scan
+_BRACKET_RE = re.compile(r"[\[\]]")
+# "key=value" items; keys may be dotted (e.g. "quiz_state.progress") and must
+# start the input or follow a ';' or newline. A value runs until a separator
+# that is followed by the next "key=", so semicolons inside JSON strings are kept
+_ITEM_RE = re.compile(
+    r"(?:\A|[;\n])\s*([A-Za-z_][\w.]*)\s*=\s*(.*?)\s*(?=[;\n]\s*[A-Za-z_][\w.]*\s*=|;?\s*\Z)",
+    re.DOTALL
+)
+# Tool input wrapped in braces, e.g. "{ current_topic_id=2; quiz_state={...} }"
+_WRAPPED_INPUT_RE = re.compile(r"\A\{\s*([A-Za-z_][\w.]*\s*=.*)\}\Z", re.DOTALL)
+
+# Directories searched for prompt files, resolved once at import: next to this
+# module, then the working directory and its parent (e.g. for Jupyter notebooks)
+_PROMPT_DIRS = list(dict.fromkeys([Path(__file__).resolve().parent, Path.cwd(), Path.cwd().parent]))
+
 def bulk_set_state(state: Dict[str, Any], updates: List[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
     """
     Creates a list of merged state update tuples from a list of field updates.
@@ -35,6 +56,10 @@ def bulk_set_state(state: Dict[str, Any], updates: List[Tuple[str, Any]]) -> Lis
         ...     ("quiz_state", {"state": "awaiting_answer"})
         ... ])
         [("quiz_state", {"state": "awaiting_answer", "progress": 0})]  # Preserves progress
+    
+    Merged values are built with shallow copies, so they may share nested objects
+    with `state` and `updates`. Callers must treat both as immutable, as LangGraph
+    reducers do, and never mutate returned values in place.
     """
     
     # Track merged updates
@@ -44,14 +69,15 @@ def bulk_set_state(state: Dict[str, Any], updates: List[Tuple[str, Any]]) -> Lis
         if "." in field_name:
             # Handle nested updates (e.g., "quiz_state.progress")
             parent, child = field_name.split(".", 1)
-            parent_value = deepcopy(state.get(parent, {}))
+            parent_value = state.get(parent, {})
             if isinstance(parent_value, dict):
+                parent_value = dict(parent_value)
                 if isinstance(value, dict):
                     # Merge dictionaries for nested updates
                     if child in parent_value:
                         parent_value[child] = {**parent_value[child], **value}
                     else:
-                        parent_value[child] = deepcopy(value)
+                        parent_value[child] = value
                 else:
                     parent_value[child] = value
                 merged_updates.append((parent, parent_value))
@@ -60,16 +86,16 @@ def bulk_set_state(state: Dict[str, Any], updates: List[Tuple[str, Any]]) -> Lis
             if isinstance(value, dict):
                 if field_name in state and isinstance(state[field_name], dict):
                     # Merge with existing dictionary
-                    merged_value = {**deepcopy(state[field_name]), **deepcopy(value)}
+                    merged_value = {**state[field_name], **value}
                 else:
                     # Create new dictionary
-                    merged_value = deepcopy(value)
+                    merged_value = dict(value)
                 merged_updates.append((field_name, merged_value))
             # Handle list updates for flashcard_states
             elif field_name == "flashcard_states":
                 # Ensure value is a list
                 if not isinstance(value, list):
-                    print(f"Warning: Expected list for flashcard_states but got {type(value)}")
+                    logger.warning("Expected list for flashcard_states but got %s", type(value))
                     continue
                     
                 # Get current flashcards, ensure it's a list
@@ -77,151 +103,144 @@ def bulk_set_state(state: Dict[str, Any], updates: List[Tuple[str, Any]]) -> Lis
                 if not isinstance(current_flashcards, list):
                     current_flashcards = []
                     
-                updated_flashcards = list(deepcopy(current_flashcards))
+                updated_flashcards = list(current_flashcards)
+                
+                # Index flashcards by id once (first occurrence wins, as before)
+                index_by_id = {}
+                for i, card in enumerate(updated_flashcards):
+                    if isinstance(card, dict):
+                        index_by_id.setdefault(card.get("id"), i)
                 
                 # Update existing flashcards or append new ones
                 for new_card in value:
                     if not isinstance(new_card, dict):
-                        print(f"Warning: Invalid flashcard format: {new_card}")
+                        logger.warning("Invalid flashcard format: %s", new_card)
                         continue
                         
-                    found = False
-                    for i, card in enumerate(updated_flashcards):
-                        if isinstance(card, dict) and card.get("id") == new_card.get("id"):
-                            updated_flashcards[i] = {**card, **deepcopy(new_card)}
-                            found = True
-                            break
-                    if not found:
-                        updated_flashcards.append(deepcopy(new_card))
+                    i = index_by_id.get(new_card.get("id"))
+                    if i is not None:
+                        updated_flashcards[i] = {**updated_flashcards[i], **new_card}
+                    else:
+                        index_by_id[new_card.get("id")] = len(updated_flashcards)
+                        updated_flashcards.append(dict(new_card))
                 
                 merged_updates.append((field_name, updated_flashcards))
             else:
-                merged_updates.append((field_name, deepcopy(value)))
+                merged_updates.append((field_name, value))
     return merged_updates
 
 def parse_tool_input(input_str: str) -> List[Tuple[str, Any]]:
     """Parse the tool input string into a list of (key, value) tuples."""
     updates = []
-    # Clean up the input string
+    # Clean up the input string, dropping braces wrapped around the whole input
     input_str = input_str.strip()
-    
-    # Split by semicolon and filter out empty items
-    items = [item.strip() for item in input_str.split(';') if item.strip()]
-    
-    for item in items:
+    wrapped = _WRAPPED_INPUT_RE.match(input_str)
+    if wrapped:
+        input_str = wrapped.group(1)
+    
+    parsed_any = False
+    for match in _ITEM_RE.finditer(input_str):
+        parsed_any = True
+        key, value = match.group(1), match.group(2)
+        
+        # Try to parse the JSON value
         try:
-            # Split by first equals sign
-            key, value = item.strip().split('=', 1)
-            key = key.strip()
-            value = value.strip()
-            
-            # Try to parse the JSON value
-            try:
-                parsed_value = json.loads(value)
-                # For flashcard_states, ensure we have a list of dicts
-                if key == "flashcard_states":
-                    if not isinstance(parsed_value, list):
-                        print(f"Warning: flashcard_states must be a list, got {type(parsed_value)}")
-                        continue
-                    # Validate each flashcard is a dict
-                    parsed_value = [card for card in parsed_value if isinstance(card, dict)]
-            except json.JSONDecodeError as e:
-                print(f"JSON parse error for value: {value}")
-                print(f"Error: {str(e)}")
-                # If JSON parsing fails, use the string value as is, but not for lists
-                if key == "flashcard_states":
-                    continue  # Skip invalid flashcard states
-                parsed_value = value
-                
-            updates.append((key, parsed_value))
-        except ValueError as e:
-            print(f"Error parsing item '{item}': {str(e)}")
-            continue
+            parsed_value = orjson.loads(value)
+            # For flashcard_states, ensure we have a list of dicts
+            if key == "flashcard_states":
+                if not isinstance(parsed_value, list):
+                    logger.warning("flashcard_states must be a list, got %s", type(parsed_value))
+                    continue
+                # Validate each flashcard is a dict
+                parsed_value = [card for card in parsed_value if isinstance(card, dict)]
+        except orjson.JSONDecodeError as e:
+            logger.warning("JSON parse error for value %r: %s", value, e)
+            # If JSON parsing fails, use the string value as is, but not for lists
+            if key == "flashcard_states":
+                continue  # Skip invalid flashcard states
+            parsed_value = value
             
+        updates.append((key, parsed_value))
+    
+    if input_str and not parsed_any:
+        logger.warning("No key=value items found in tool input %r", input_str)
     return updates
 
-def parse_llm_plan_response(response_content: str) -> List[Tuple[str, str, str, List[Tuple[str, Any]]]]:
+def _find_closing_bracket(text: str, start: int, end: int) -> int:
+    """Return the index of the ']' matching the '[' at text[start], or -1 if unmatched before end."""
+    depth = 0
+    for match in _BRACKET_RE.finditer(text, start, end):
+        if match.group() == "[":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.start()
+    return -1
+
+def parse_llm_plan_response(response_content: str) -> Iterator[Tuple[str, str, str, List[Tuple[str, Any]]]]:
     """Parse the LLM's plan response into structured plan steps.
     
+    Steps are yielded as they are parsed; wrap the call in list() if a list is needed.
+    
     Args:
         response_content: Raw response string from the LLM
         
-    Returns:
-        List of tuples (description, step_id, tool_name, updates) where:
+    Yields:
+        Tuples (description, step_id, tool_name, updates) where:
         - description: Plan description string
         - step_id: Step identifier (e.g., "E1")
         - tool_name: Name of the tool to execute
         - updates: List of (key, value) tuples for tool input
     """
-    plans = []
-    
-    # Split response into plan sections
-    plan_sections = response_content.split("\nPlan: ")
-    
-    for section in plan_sections:
-        if not section.strip():  # Skip empty sections
-            continue
-            
+    # Plan sections are spans of the response between "Plan:" headers; any text
+    # before the first header is scanned too. Spans are searched in place with
+    # pos/endpos, so no per-section substrings are built.
+    headers = list(_PLAN_RE.finditer(response_content))
+    section_spans = [(0, headers[0].start() if headers else len(response_content))]
+    section_spans += [
+        (header.end(), headers[i + 1].start() if i + 1 < len(headers) else len(response_content))
+        for i, header in enumerate(headers)
+    ]
+    
+    for section_start, section_end in section_spans:
         try:
-            # Split section into description and steps
-            parts = section.split("\n#E")
+            steps = list(_STEP_RE.finditer(response_content, section_start, section_end))
+            if not steps:  # Skip sections without steps
+                continue
             
-            # First part is the plan description
-            plan_description = parts[0].strip()
-            if plan_description.startswith("Plan: "):  # Handle first section
-                plan_description = plan_description[6:].strip()
+            # Text before the first step is the plan description
+            plan_description = response_content[section_start:steps[0].start()].strip()
             
             # Process each step in this plan section
-            for step_text in parts[1:]:
+            for i, step in enumerate(steps):
                 try:
-                    # Parse step ID
-                    step_parts = step_text.split("=", 1)  # Split on first = only
-                    if len(step_parts) != 2:
-                        continue
-                        
-                    step_id = "E" + step_parts[0].strip()
-                    tool_part = step_parts[1].strip()
-                    
-                    # Find tool name (everything before the first [)
-                    tool_name_end = tool_part.find("[")
-                    if tool_name_end == -1:
-                        continue
-                    tool_name = tool_part[:tool_name_end].strip()
+                    step_id = "E" + step.group(1)
+                    tool_name = step.group(2)
                     
-                    # Find matching brackets for tool input
-                    bracket_count = 0
-                    start_idx = tool_name_end
-                    end_idx = -1
+                    # Find the bracket closing the tool input, without crossing into the next step
+                    start_idx = step.end() - 1
+                    step_end = steps[i + 1].start() if i + 1 < len(steps) else section_end
+                    end_idx = _find_closing_bracket(response_content, start_idx, step_end)
                     
-                    for i, char in enumerate(tool_part[start_idx:], start=start_idx):
-                        if char == '[':
-                            bracket_count += 1
-                        elif char == ']':
-                            bracket_count -= 1
-                            if bracket_count == 0:
-                                end_idx = i
-                                break
-                    
-                    if end_idx == -1 or bracket_count != 0:
-                        print(f"Warning: Unmatched brackets in step {step_id}")
+                    if end_idx == -1:
+                        logger.warning("Unmatched brackets in step %s", step_id)
                         continue
                         
                     # Extract tool input between matched brackets
-                    tool_input = tool_part[start_idx + 1:end_idx].strip()
+                    tool_input = response_content[start_idx + 1:end_idx].strip()
                     
                     # Parse the tool input into a list of (key, value) tuples
                     updates = parse_tool_input(tool_input)
-                    plans.append((plan_description, step_id, tool_name, updates))
+                    yield plan_description, step_id, tool_name, updates
                     
                 except Exception as e:
-                    print(f"Error parsing step in section: {e}")
+                    logger.error("Error parsing step in section: %s", e)
                     continue
                     
         except Exception as e:
-            print(f"Error parsing plan section: {e}")
+            logger.error("Error parsing plan section: %s", e)
             continue
-    
-    return plans
 
 def populate_flashcards(topic_id: int) -> Dict[str, Any]:
     """Populate flashcard states with new list of flashcard state entries for a specific topic.
@@ -232,22 +251,11 @@ def populate_flashcards(topic_id: int) -> Dict[str, Any]:
     Returns:
         Dictionary containing the updated flashcard_states
     """
-    flashcards = get_flashcards_by_topic_id(topic_id)
-    
-    # Initialize new flashcard states
-    new_flashcard_states = []
-    
-    # Create state entry for each flashcard
-    for flashcard in flashcards:
-        new_flashcard_states.append({
-            "id": flashcard["id"],
-            "status": "queued",
-            "question": flashcard["question"],
-            "marking_criteria": flashcard["marking_criteria"],
-            "attempts": 0,
-            "user_answers": [],
-            "evaluation": None
-        })
+    # Create state entry for each flashcard from its cached template
+    new_flashcard_states = [
+        {**template, "user_answers": []}
+        for template in get_topic_state_templates(topic_id)
+    ]
     
     # Set first flashcard as active if there are any
     if new_flashcard_states:
@@ -255,6 +263,7 @@ def populate_flashcards(topic_id: int) -> Dict[str, Any]:
     
     return new_flashcard_states
 
+@lru_cache(maxsize=1)
 def create_responder_chain():
     """Create the response generation chain for interactive communication.
     
@@ -282,8 +291,11 @@ def create_responder_chain():
     
     return prompt | model
 
+@lru_cache(maxsize=None)
 def load_prompt(prompt_name: str) -> str:
     """Load a prompt from a markdown file
+
+    Results are cached by prompt name, so each file is read at most once.
     
     Args:
         prompt_name: Name of the prompt file (e.g. 'learning_session_orchestrator_prompt.md')
@@ -292,27 +304,25 @@ def load_prompt(prompt_name: str) -> str:
         The contents of the prompt file as a string
     """
     try:
-        # For Jupyter notebook environment, use the current working directory
-        prompt_path = Path(os.getcwd()) / prompt_name
-        
-        # Check if the file exists
-        if not prompt_path.exists():
-            # Try one directory up if not found
-            prompt_path = Path(os.getcwd()).parent / prompt_name
-            if not prompt_path.exists():
-                raise FileNotFoundError(
-                    f"Prompt file not found. Searched in:\n"
-                    f"1. {Path(os.getcwd()) / prompt_name}\n"
-                    f"2. {prompt_path}"
-                )
+        prompt_path = next(
+            (directory / prompt_name for directory in _PROMPT_DIRS
+             if (directory / prompt_name).is_file()),
+            None
+        )
+        if prompt_path is None:
+            searched = "\n".join(
+                f"{i}. {directory / prompt_name}" for i, directory in enumerate(_PROMPT_DIRS, 1)
+            )
+            raise FileNotFoundError(f"Prompt file not found. Searched in:\n{searched}")
         
-        logger.info(f"Loading prompt from: {prompt_path}")
+        logger.info("Loading prompt from: %s", prompt_path)
         with open(prompt_path, "r", encoding='utf-8') as f:
             return f.read()
     except Exception as e:
-        logger.error(f"Failed to load prompt {prompt_name}: {e}")
+        logger.error("Failed to load prompt %s: %s", prompt_name, e)
         raise
 
+@lru_cache(maxsize=1)
 def create_planner_chain():
     """Create the planner chain with Groq LLM
     
@@ -329,19 +339,23 @@ def create_planner_chain():
         groq_api_key=os.environ["GROQ_API_KEY"]
     )
     
-    # Create a formatted template with escaped JSON braces
+    # Order messages from most to least stable so provider-side prompt caching
+    # can reuse the prefix: static instructions, then the per-session topic
+    # list, then the state that changes every turn (messages last)
     prompt = ChatPromptTemplate.from_messages([
         ("system", prompt_template),
+        ("user", """Topics:
+        {topics}"""),
         ("user", f"""Here is the current state:
 
         Current Topic ID: 
         {{current_topic_id}}
 
-        Topics:
-        {{topics}}
+        Hard Flashcards:
+        {{hard_flashcards}}
 
-        Flashcard States:
-        {{flashcard_states}}
+        User:
+        {{user}}
 
         Score:
         {{score}}
@@ -349,14 +363,11 @@ def create_planner_chain():
         Quiz State:
         {{quiz_state}}
 
-        User:
-        {{user}}
+        Flashcard States:
+        {{flashcard_states}}
 
         Messages:
         {{messages}}
-
-        Hard Flashcards:
-        {{hard_flashcards}}
         """)
 ])
     
@@ -365,6 +376,7 @@ def create_planner_chain():
     
     return chain
 
+@lru_cache(maxsize=1)
 def create_evaluator_chain():
     """Create the evaluator chain with Groq LLM
     
@@ -0,0 +1,73 @@
+from typing import Any, Callable
+from contextlib import nullcontext
+from functools import wraps
+import inspect
+import logging
+import time
+
+# OpenTelemetry is optional; without it node timings are only logged
+try:
+    from opentelemetry import trace
+    tracer = trace.get_tracer(__name__)
+except ImportError:
+    trace = None
+    tracer = None
+
+logger = logging.getLogger(__name__)
+
+def timed_node(name: str) -> Callable:
+    """Decorator that times a graph node and records it as a tracing span.
+
+    Args:
+        name: Span name, usually the node name used in the graph
+
+    Returns:
+        A decorator wrapping the node function
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(state, *args, **kwargs):
+                with _node_span(name):
+                    start = time.perf_counter()
+                    try:
+                        return await func(state, *args, **kwargs)
+                    finally:
+                        _record_duration(name, start)
+            return async_wrapper
+        
+        @wraps(func)
+        def wrapper(state, *args, **kwargs):
+            with _node_span(name):
+                start = time.perf_counter()
+                try:
+                    return func(state, *args, **kwargs)
+                finally:
+                    _record_duration(name, start)
+        return wrapper
+    return decorator
+
+def _node_span(name: str):
+    return tracer.start_as_current_span(name) if tracer is not None else nullcontext()
+
+def _record_duration(name: str, start: float) -> None:
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    set_span_attributes(duration_ms=elapsed_ms)
+    logger.debug("Node %s took %.1f ms", name, elapsed_ms)
+
+def set_span_attributes(**attributes: Any) -> None:
+    """Attach attributes to the current span, if tracing is enabled."""
+    if trace is None:
+        return
+    span = trace.get_current_span()
+    for key, value in attributes.items():
+        if value is not None:
+            span.set_attribute(key, value)
+
+def record_token_usage(response: Any) -> None:
+    """Attach prompt/completion token counts from an LLM response to the current span."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    set_span_attributes(
+        prompt_tokens=usage.get("input_tokens"),
+        completion_tokens=usage.get("output_tokens")
+    )
@@ -1,34 +1,114 @@
 import sqlite3
 from typing import List, Dict, Any
 from contextlib import contextmanager
+from collections import namedtuple
+import atexit
 import os
+import threading
 
 DB_PATH = "tutor.db"
 
+FLASHCARDS_BY_TOPIC_SQL = (
+    "SELECT id, topic_id, question, marking_criteria FROM flashcards WHERE topic_id = ?"
+)
+ALL_FLASHCARDS_SQL = (
+    "SELECT id, topic_id, question, marking_criteria FROM flashcards ORDER BY topic_id, id"
+)
+
+# Bump when quiz_schema.sql changes; stored in the database's PRAGMA user_version
+SCHEMA_VERSION = 1
+
+FlashcardRow = namedtuple("FlashcardRow", "id topic_id question marking_criteria")
+
+# sqlite3 connections must not be shared between threads, so keep one per thread,
+# together with the DB_PATH it was opened for
+_local = threading.local()
+# DB_PATH values whose schema init_db() has already checked in this process
+_initialized_paths = set()
+
 def init_db():
-    """Initialize the database with topics and flashcards tables."""
-    # Check if tables already exist
+    """Initialize the database with topics and flashcards tables.
+    
+    The schema version is stamped in PRAGMA user_version, so later calls
+    return after a single integer read, or immediately for a DB_PATH already
+    initialized in this process.
+    """
+    if DB_PATH in _initialized_paths:
+        return
+    
     with get_db() as db:
-        cursor = db.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND (name='topics' OR name='flashcards')"
-        )
-        existing_tables = {row['name'] for row in cursor.fetchall()}
-        
-        if 'topics' not in existing_tables or 'flashcards' not in existing_tables:
-            # Read and execute schema file
-            with open('quiz_schema.sql', 'r') as f:
-                db.executescript(f.read())
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            # Databases created before versioning may already have the tables
+            cursor = db.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND (name='topics' OR name='flashcards')"
+            )
+            existing_tables = {row['name'] for row in cursor.fetchall()}
+            
+            if 'topics' not in existing_tables or 'flashcards' not in existing_tables:
+                # Read and execute schema file
+                with open('quiz_schema.sql', 'r') as f:
+                    db.executescript(f.read())
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
             db.commit()
+    _initialized_paths.add(DB_PATH)
+
+def reset_schema_version():
+    """Clear the stored schema version so the next init_db() recreates the tables.
+    
+    Call this after dropping tables from the current DB_PATH.
+    """
+    with get_db() as db:
+        db.execute("PRAGMA user_version = 0")
+        db.commit()
+    _initialized_paths.discard(DB_PATH)
+
+def _connect() -> sqlite3.Connection:
+    """Open a configured connection; it is closed when the process exits."""
+    # check_same_thread=False only so the atexit hook may close it from the main thread
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    atexit.register(conn.close)
+    return conn
 
 @contextmanager
 def get_db():
-    """Context manager for database connections."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """Context manager yielding this thread's persistent database connection.
+    
+    The connection is opened on first use and reused afterwards; it is
+    reopened if DB_PATH has changed since. Changes not committed by the end
+    of the block are rolled back, so no transaction or write lock outlives it.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path != DB_PATH:
+        close_db()
+        conn = None
+    if conn is None:
+        conn = _local.conn = _connect()
+        _local.path = DB_PATH
     try:
         yield conn
     finally:
+        if conn.in_transaction:
+            conn.rollback()
+
+def close_db():
+    """Close this thread's database connection; the next get_db() reopens it."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        atexit.unregister(conn.close)
         conn.close()
+        _local.conn = None
+
+def _fetch_flashcards(sql: str, params: tuple = ()):
+    """Run a flashcard query and return its rows as FlashcardRow namedtuples."""
+    with get_db() as db:
+        cursor = db.cursor()
+        cursor.row_factory = lambda cursor, row: FlashcardRow(*row)
+        cursor.execute(sql, params)
+        return cursor.fetchall()
 
 def get_flashcards_by_topic_id(topic_id: int):
     """Retrieve all flashcards for a given topic.
@@ -37,15 +117,18 @@ def get_flashcards_by_topic_id(topic_id: int):
         topic_id: ID of the topic to get flashcards for
         
     Returns:
-        List of flashcard dictionaries with id, topic_id, question and answer
+        List of FlashcardRow namedtuples (id, topic_id, question, marking_criteria)
     """
-    with get_db() as db:
-        cursor = db.execute(
-            "SELECT id, topic_id, question, marking_criteria FROM flashcards WHERE topic_id = ?", 
-            (topic_id,)
-        )
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
+    return _fetch_flashcards(FLASHCARDS_BY_TOPIC_SQL, (topic_id,))
+
+def get_all_flashcards():
+    """Retrieve every flashcard in a single query.
+    
+    Returns:
+        List of FlashcardRow namedtuples (id, topic_id, question, marking_criteria),
+        ordered by topic_id and id
+    """
+    return _fetch_flashcards(ALL_FLASHCARDS_SQL)
 
 if __name__ == "__main__":
-    print(get_flashcards_by_topic_id(1)[1]['question'])
+    print(get_flashcards_by_topic_id(1)[1].question)